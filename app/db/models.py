@@ -1,20 +1,25 @@
 from typing import Optional, List
+from sqlalchemy import Index
 from sqlmodel import SQLModel, Field, Relationship
 from datetime import datetime
 
 
 class User(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
-    google_id: Optional[str] = None        # <--- FIXED (Optional)
-    email: str
+    google_id: Optional[str] = Field(default=None, index=True, unique=True)  # <--- FIXED (Optional)
+    email: str = Field(index=True, unique=True)
     name: Optional[str] = None
     picture: Optional[str] = None
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
     articles: List["Article"] = Relationship(back_populates="author")
 
 
 class Article(SQLModel, table=True):
+    # Backs the trending ORDER BY views, likes, created_at DESC (scanned backwards)
+    __table_args__ = (Index("ix_article_trending", "views", "likes", "created_at"),)
+
     id: Optional[int] = Field(default=None, primary_key=True)
     title: str
     content: str
@@ -27,5 +32,9 @@ class Article(SQLModel, table=True):
     updated_at: datetime = Field(default_factory=datetime.utcnow)
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
-    author_id: int = Field(foreign_key="user.id")
-    author: Optional[User] = Relationship(back_populates="articles")
+    author_id: int = Field(foreign_key="user.id", index=True)
+    # lazy="raise": load the author explicitly (e.g. selectinload) instead of N+1-ing
+    author: Optional[User] = Relationship(
+        back_populates="articles",
+        sa_relationship_kwargs={"lazy": "raise"},
+    )
@@ -1,7 +1,9 @@
 # app/db/session.py
 import os
 from dotenv import load_dotenv
-from sqlmodel import create_engine, Session
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 load_dotenv()
 
@@ -9,14 +11,43 @@ DATABASE_URL = os.getenv("DATABASE_URL")
 if not DATABASE_URL:
     raise RuntimeError("DATABASE_URL not set in environment (.env)")
 
+# Point the URL at an async driver (asyncpg for Postgres, aiosqlite locally)
+if DATABASE_URL.startswith("postgres://"):
+    DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql+asyncpg://", 1)
+elif DATABASE_URL.startswith("postgresql://"):
+    DATABASE_URL = DATABASE_URL.replace("postgresql://", "postgresql+asyncpg://", 1)
+elif DATABASE_URL.startswith("sqlite://"):
+    DATABASE_URL = DATABASE_URL.replace("sqlite://", "sqlite+aiosqlite://", 1)
+
 # If you use SQLite locally (e.g. sqlite:///./quillr.db) we need connect_args
 connect_args = {}
 if DATABASE_URL.startswith("sqlite"):
     connect_args = {"check_same_thread": False}
 
-# echo=True is useful for dev (prints SQL queries). Turn off in production.
-engine = create_engine(DATABASE_URL, echo=True, connect_args=connect_args)
+# Hosted Postgres URLs often carry libpq's ?sslmode=...; asyncpg rejects it as
+# a URL param and takes the same modes through its `ssl` argument instead
+if DATABASE_URL.startswith("postgresql+asyncpg"):
+    url = make_url(DATABASE_URL)
+    sslmode = url.query.get("sslmode")
+    if sslmode:
+        DATABASE_URL = url.difference_update_query(["sslmode"]).render_as_string(hide_password=False)
+        connect_args = {"ssl": sslmode}
+
+# Set SQL_ECHO=1 in dev to print SQL queries. Keep it off in production.
+SQL_ECHO = os.getenv("SQL_ECHO") == "1"
+
+engine = create_async_engine(
+    DATABASE_URL,
+    echo=SQL_ECHO,
+    pool_size=30,
+    max_overflow=20,
+    pool_recycle=3600,
+    pool_pre_ping=True,
+    connect_args=connect_args,
+)
 
-def get_session():
-    with Session(engine) as session:
+async def get_session():
+    # expire_on_commit=False so returned objects can be serialized after commit
+    # without triggering a lazy (and, under asyncio, illegal) reload.
+    async with AsyncSession(engine, expire_on_commit=False) as session:
         yield session
@@ -0,0 +1,66 @@
+# app/db/users.py
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.db.models import User
+
+
+async def upsert_google_user(
+    session: AsyncSession,
+    google_id: str,
+    email: str,
+    name: Optional[str],
+    picture: Optional[str],
+) -> Optional[int]:
+    """
+    Find or create the user for a Google sign-in and return their id.
+    Matches on google_id, falling back to an existing account with the same
+    email (linking google_id onto it if it has none).
+    """
+    now = datetime.utcnow()
+    profile = {"email": email, "name": name, "picture": picture, "updated_at": now}
+
+    # Common case: new or returning Google user, one atomic round trip
+    statement = (
+        pg_insert(User)
+        .values(google_id=google_id, **profile)
+        .on_conflict_do_update(index_elements=["google_id"], set_=profile)
+        .returning(User.id)
+    )
+    try:
+        user_id = (await session.execute(statement)).scalar_one()
+        await session.commit()
+        return user_id
+    except IntegrityError:
+        # The email belongs to another account
+        await session.rollback()
+
+    # Account created without Google sign-in: attach this google_id to it
+    statement = (
+        update(User)
+        .where(User.email == email, User.google_id.is_(None))
+        .values(google_id=google_id, name=name, picture=picture, updated_at=now)
+        .returning(User.id)
+    )
+    try:
+        user_id = (await session.execute(statement)).scalar_one_or_none()
+        await session.commit()
+    except IntegrityError:
+        await session.rollback()
+        user_id = None
+    if user_id is not None:
+        return user_id
+
+    # Otherwise sign in to the existing account unchanged, preferring the
+    # one already bound to this google_id over the one holding the email
+    for condition in (User.google_id == google_id, User.email == email):
+        user_id = (await session.exec(select(User.id).where(condition))).first()
+        if user_id is not None:
+            return user_id
+    return None
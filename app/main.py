@@ -1,30 +1,33 @@
 # app/main.py
 import os
+import hashlib
 from typing import Optional
 from datetime import datetime, timedelta
 
-from fastapi import FastAPI, Request, HTTPException
-from fastapi.responses import RedirectResponse, JSONResponse
+from fastapi import FastAPI, Request, Response, Depends
+from fastapi.responses import RedirectResponse, JSONResponse, ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from starlette.middleware.sessions import SessionMiddleware
 
-from jose import jwt, JWTError
+import httpx
 from authlib.integrations.starlette_client import OAuth, OAuthError
-from sqlmodel import Session, select, SQLModel
+from cachetools import TTLCache
+from sqlmodel import select, SQLModel
+from sqlmodel.ext.asyncio.session import AsyncSession
 from dotenv import load_dotenv
 
 # PostgreSQL engine & models from your db package
-from app.db.session import engine
+from app.db.session import engine, get_session
 from app.db.models import User  # <- use model defined in app/db/models.py
+from app.db.users import upsert_google_user
 from app.routers import articles
+from app.utils.auth import SECRET_KEY, create_jwt, verify_token, current_user_id
 
 load_dotenv()
 
 # ===============================
 # CONFIG
 # ===============================
-SECRET_KEY = os.getenv("SECRET_KEY", "dev-secret-please-change")
-ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 * 7  # 7 days
 
 GOOGLE_CLIENT_ID = os.getenv("GOOGLE_CLIENT_ID")
@@ -35,9 +38,36 @@ BASE_URL = os.getenv("BASE_URL", "https://quillr-backend.onrender.com/")
 if not GOOGLE_CLIENT_ID or not GOOGLE_CLIENT_SECRET:
     raise RuntimeError("Set GOOGLE_CLIENT_ID and GOOGLE_CLIENT_SECRET in .env")
 
+# user_id -> (public profile fields, ETag) served by /auth/me. The profile is
+# only written on login (google_callback), which drops the entry here; other
+# workers pick the change up when their entry expires.
+_user_cache: TTLCache = TTLCache(maxsize=10_000, ttl=60)
+
 # ===============================
 # OAUTH SETUP
 # ===============================
+class _SharedTransport(httpx.AsyncHTTPTransport):
+    """
+    Keep-alive connection pool shared by every Authlib client.
+    Authlib opens a fresh AsyncOAuth2Client per call and closes it on exit;
+    ignoring that close lets the TLS connections to Google be reused.
+    """
+
+    async def __aexit__(self, *args) -> None:
+        pass
+
+    async def aclose(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        await super().aclose()
+
+
+google_transport = _SharedTransport(
+    http2=True,
+    limits=httpx.Limits(max_keepalive_connections=50),
+)
+
 oauth = OAuth()
 CONF_URL = "https://accounts.google.com/.well-known/openid-configuration"
 
@@ -46,17 +76,31 @@ oauth.register(
     client_id=GOOGLE_CLIENT_ID,
     client_secret=GOOGLE_CLIENT_SECRET,
     server_metadata_url=CONF_URL,
-    client_kwargs={"scope": "openid email profile"},
+    client_kwargs={"scope": "openid email profile", "transport": google_transport},
 )
 
 # ===============================
 # FASTAPI INIT
 # ===============================
-app = FastAPI(title="Quillr API")
+app = FastAPI(title="Quillr API", default_response_class=ORJSONResponse)
+
+class OAuthSessionMiddleware(SessionMiddleware):
+    """
+    SessionMiddleware that only runs for the Google OAuth routes, the only
+    ones that read request.session (Authlib's state/nonce). Everything else
+    skips the signed-cookie decode.
+    """
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and not scope["path"].startswith("/auth/google/"):
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
+
 
 # Sessions for Authlib (must be installed before routes that use oauth)
 app.add_middleware(
-    SessionMiddleware,
+    OAuthSessionMiddleware,
     secret_key=SECRET_KEY,
     session_cookie="quillr_session",
     same_site="lax",
@@ -75,11 +119,41 @@ app.add_middleware(
 # Routers
 app.include_router(articles.router, prefix="/articles", tags=["Articles"])
 
-# Create DB tables at startup
 @app.on_event("startup")
-def on_startup():
-    # Create tables (based on models in app.db.models)
-    SQLModel.metadata.create_all(engine)
+async def warm_google_metadata():
+    # Fetch Google's OIDC discovery doc + JWKs once; Authlib keeps them on
+    # oauth.google for the process lifetime, so callbacks skip both fetches.
+    try:
+        await oauth.google.load_server_metadata()
+        await oauth.google.fetch_jwk_set()
+    except httpx.HTTPError:
+        pass  # Authlib falls back to fetching them on first login
+
+@app.on_event("startup")
+async def open_http_client():
+    # Keep-alive client for outbound calls made directly by routers
+    app.state.http_client = httpx.AsyncClient(
+        timeout=10.0,
+        limits=httpx.Limits(max_keepalive_connections=20, max_connections=100),
+    )
+
+@app.on_event("shutdown")
+async def close_google_transport():
+    await google_transport.shutdown()
+
+@app.on_event("shutdown")
+async def close_http_client():
+    await app.state.http_client.aclose()
+
+# Schema is managed by Alembic (`alembic upgrade head`; databases made by the
+# old create_all need a one-off `alembic stamp 0001` first). For throwaway
+# local DBs set AUTO_CREATE_TABLES=1 to create tables at startup instead.
+if os.getenv("AUTO_CREATE_TABLES") == "1":
+    @app.on_event("startup")
+    async def on_startup():
+        # Create tables (based on models in app.db.models)
+        async with engine.begin() as conn:
+            await conn.run_sync(SQLModel.metadata.create_all)
 
 
 # ===============================
@@ -89,14 +163,7 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     expire = datetime.utcnow() + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
     to_encode.update({"exp": expire})
-    return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
-
-
-def verify_token(token: str):
-    try:
-        return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-    except JWTError:
-        return None
+    return create_jwt(to_encode)
 
 
 # ===============================
@@ -109,7 +176,7 @@ async def google_login(request: Request):
 
 
 @app.get("/auth/google/callback")
-async def google_callback(request: Request):
+async def google_callback(request: Request, session: AsyncSession = Depends(get_session)):
     try:
         token = await oauth.google.authorize_access_token(request)
     except OAuthError as e:
@@ -129,19 +196,17 @@ async def google_callback(request: Request):
     if not google_id:
         return JSONResponse({"error": "No google id returned"}, status_code=400)
 
-    # Store or get user in PostgreSQL
-    with Session(engine) as session:
-        statement = select(User).where(User.google_id == google_id)
-        user = session.exec(statement).first()
+    if not email:
+        return JSONResponse({"error": "No email returned"}, status_code=400)
 
-        if not user:
-            user = User(google_id=google_id, email=email, name=name, picture=picture)
-            session.add(user)
-            session.commit()
-            session.refresh(user)
+    # Insert or refresh the user in PostgreSQL (one round trip in the common case)
+    user_id = await upsert_google_user(session, google_id, email, name, picture)
+    if user_id is None:
+        return JSONResponse({"error": "Could not sign in this Google account"}, status_code=400)
+    _user_cache.pop(user_id, None)
 
     # Create JWT
-    token_data = {"user_id": user.id, "email": user.email}
+    token_data = {"user_id": user_id, "email": email}
     access_token = create_access_token(token_data)
 
     # Set cookie and redirect to frontend dashboard
@@ -161,7 +226,11 @@ async def google_callback(request: Request):
 # AUTH CHECK
 # ===============================
 @app.get("/auth/me")
-def auth_me(request: Request):
+async def auth_me(
+    request: Request,
+    response: Response,
+    session: AsyncSession = Depends(get_session),
+):
     token = request.cookies.get("quillr_token")
     if not token:
         return {"user": None}
@@ -176,26 +245,43 @@ def auth_me(request: Request):
     if not user_id:
         return {"user": None}
 
-    with Session(engine) as session:
-        user = session.get(User, user_id)
-        if not user:
+    cached = _user_cache.get(user_id)
+    if cached is None:
+        # Only fetch the columns we return; skips building a full User instance
+        statement = (
+            select(User.id, User.email, User.name, User.picture, User.updated_at)
+            .where(User.id == user_id)
+        )
+        row = (await session.exec(statement)).first()
+        if not row:
             return {"user": None}
 
-        return {
-            "user": {
-                "id": user.id,
-                "email": user.email,
-                "name": user.name,
-                "picture": user.picture,
-            }
+        user = {
+            "id": row.id,
+            "email": row.email,
+            "name": row.name,
+            "picture": row.picture,
         }
+        # Versioned by (user_id, updated_at), which every profile write bumps
+        version = f"{row.id}:{row.updated_at.isoformat()}".encode()
+        etag = '"' + hashlib.blake2b(version, digest_size=8).hexdigest() + '"'
+        cached = (user, etag)
+        _user_cache[user_id] = cached
+
+    user, etag = cached
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache", "Vary": "Cookie"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+
+    response.headers.update(headers)
+    return {"user": user}
 
 
 # ===============================
 # LOGOUT
 # ===============================
 @app.post("/auth/logout")
-def logout():
+async def logout():
     response = JSONResponse({"ok": True})
     response.delete_cookie("quillr_token")
     return response
@@ -205,10 +291,35 @@ def logout():
 # USER'S ARTICLES (placeholder)
 # ===============================
 @app.get("/api/me/articles")
-def my_articles(request: Request):
-    token = request.cookies.get("quillr_token")
-    payload = verify_token(token) if token else None
-    if not payload:
-        raise HTTPException(status_code=401, detail="Not authenticated")
+async def my_articles(user_id: int = Depends(current_user_id)):
+    return {"articles": [], "user_id": user_id}
+
 
-    return {"articles": [], "user_id": payload.get("user_id")}
+# ===============================
+# ENTRYPOINT (`python -m app.main`)
+# ===============================
+if __name__ == "__main__":
+    import uvicorn
+
+    # Equivalent to:
+    #   uvicorn app.main:app --workers $WEB_CONCURRENCY --loop uvloop --http httptools --no-access-log
+    #
+    # Connection budget: every worker opens its own DB pool of up to
+    # pool_size + max_overflow = 30 + 20 = 50 connections (app/db/session.py),
+    # so workers * 50 must stay below the Postgres plan's max_connections.
+    # Set WEB_CONCURRENCY explicitly; the fallback is the CPUs this process
+    # may run on, which in containers is still not the CPU quota.
+    if hasattr(os, "sched_getaffinity"):
+        default_workers = len(os.sched_getaffinity(0))
+    else:
+        default_workers = os.cpu_count() or 1
+
+    uvicorn.run(
+        "app.main:app",
+        host="0.0.0.0",
+        port=int(os.getenv("PORT", "8000")),
+        workers=int(os.getenv("WEB_CONCURRENCY", default_workers)),
+        loop="uvloop",
+        http="httptools",
+        access_log=False,
+    )
@@ -1,27 +1,61 @@
 # app/routers/articles.py
 
-from fastapi import APIRouter, Depends, HTTPException, Request
-from sqlmodel import Session, select
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException
+from pydantic import BaseModel, ConfigDict
+from sqlalchemy import update
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
 from datetime import datetime
 
 from app.db.session import get_session
 from app.db.models import Article
-from app.utils.auth import get_current_user_id
+from app.utils.auth import current_user_id
 
 router = APIRouter()
 
 
 # ------------------------------
-# Fetch all articles of logged-in user
+# Response schemas (plain columns only, never the author relationship)
 # ------------------------------
-@router.get("/me/all")
-def get_my_articles(request: Request, session: Session = Depends(get_session)):
-    user_id = get_current_user_id(request)
-    if not user_id:
-        raise HTTPException(status_code=401, detail="Not authenticated")
+class ArticleOut(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    title: str
+    content: str
+    cover_image: Optional[str]
+    views: int
+    likes: int
+    last_viewed_at: Optional[datetime]
+    updated_at: datetime
+    created_at: datetime
+    author_id: int
+
+
+class ArticleListOut(BaseModel):
+    articles: List[ArticleOut]
+
 
+class TrendingOut(BaseModel):
+    trending: List[ArticleOut]
+
+
+class ArticleSavedOut(BaseModel):
+    success: bool
+    article: ArticleOut
+
+
+# ------------------------------
+# Fetch all articles of logged-in user
+# ------------------------------
+@router.get("/me/all", response_model=ArticleListOut)
+async def get_my_articles(
+    user_id: int = Depends(current_user_id),
+    session: AsyncSession = Depends(get_session)
+):
     query = select(Article).where(Article.author_id == user_id)
-    articles = session.exec(query).all()
+    articles = (await session.exec(query)).all()
 
     return {"articles": articles}
 
@@ -29,16 +63,12 @@ def get_my_articles(request: Request, session: Session = Depends(get_session)):
 # ------------------------------
 # Create new article
 # ------------------------------
-@router.post("/")
-def create_article(
+@router.post("/", response_model=ArticleSavedOut)
+async def create_article(
     data: dict,
-    request: Request,
-    session: Session = Depends(get_session)
+    user_id: int = Depends(current_user_id),
+    session: AsyncSession = Depends(get_session)
 ):
-    user_id = get_current_user_id(request)
-    if not user_id:
-        raise HTTPException(status_code=401, detail="Not authenticated")
-
     title = data.get("title")
     content = data.get("content")
     cover_image = data.get("cover_image")  # optional
@@ -56,8 +86,8 @@ def create_article(
     )
 
     session.add(article)
-    session.commit()
-    session.refresh(article)
+    await session.commit()
+    await session.refresh(article)
 
     return {"success": True, "article": article}
 
@@ -65,18 +95,20 @@ def create_article(
 # ------------------------------
 # Fetch single article + auto-increment views
 # ------------------------------
-@router.get("/{article_id}")
-def get_article(article_id: int, session: Session = Depends(get_session)):
-    article = session.get(Article, article_id)
+@router.get("/{article_id}", response_model=ArticleOut)
+async def get_article(article_id: int, session: AsyncSession = Depends(get_session)):
+    # Increment views + update timestamp in a single atomic UPDATE ... RETURNING
+    statement = (
+        update(Article)
+        .where(Article.id == article_id)
+        .values(views=Article.views + 1, last_viewed_at=datetime.utcnow())
+        .returning(Article)
+    )
+    article = (await session.execute(statement)).scalar_one_or_none()
     if not article:
         raise HTTPException(status_code=404, detail="Article not found")
 
-    # Increment views + update timestamp
-    article.views += 1
-    article.last_viewed_at = datetime.utcnow()
-    session.add(article)
-    session.commit()
-    session.refresh(article)
+    await session.commit()
 
     return article
 
@@ -85,8 +117,8 @@ def get_article(article_id: int, session: Session = Depends(get_session)):
 # Trending Articles (Top 10)
 # Weighted by: views + likes + created_at
 # ------------------------------
-@router.get("/trending")
-def get_trending_articles(session: Session = Depends(get_session)):
+@router.get("/trending", response_model=TrendingOut)
+async def get_trending_articles(session: AsyncSession = Depends(get_session)):
     statement = (
         select(Article)
         .order_by(
@@ -97,7 +129,7 @@ def get_trending_articles(session: Session = Depends(get_session)):
         .limit(10)
     )
 
-    trending = session.exec(statement).all()
+    trending = (await session.exec(statement)).all()
     return {"trending": trending}
 
 
@@ -105,28 +137,29 @@ def get_trending_articles(session: Session = Depends(get_session)):
 # Like an Article
 # ------------------------------
 @router.post("/{article_id}/like")
-def like_article(article_id: int, session: Session = Depends(get_session)):
-    article = session.get(Article, article_id)
+async def like_article(article_id: int, session: AsyncSession = Depends(get_session)):
+    article = await session.get(Article, article_id)
     if not article:
         raise HTTPException(status_code=404, detail="Article not found")
 
     article.likes += 1
     session.add(article)
-    session.commit()
-    session.refresh(article)
+    await session.commit()
+    await session.refresh(article)
 
     return {"success": True, "likes": article.likes}
 
 # ------------------------------
 # Update Article
 # ------------------------------
-@router.put("/{article_id}")
-def update_article(article_id: int, data: dict, request: Request, session: Session = Depends(get_session)):
-    user_id = get_current_user_id(request)
-    if not user_id:
-        raise HTTPException(status_code=401, detail="Not authenticated")
-
-    article = session.get(Article, article_id)
+@router.put("/{article_id}", response_model=ArticleSavedOut)
+async def update_article(
+    article_id: int,
+    data: dict,
+    user_id: int = Depends(current_user_id),
+    session: AsyncSession = Depends(get_session)
+):
+    article = await session.get(Article, article_id)
     if not article:
         raise HTTPException(status_code=404, detail="Article not found")
 
@@ -145,7 +178,7 @@ def update_article(article_id: int, data: dict, request: Request, session: Sessi
     article.updated_at = datetime.utcnow()
 
     session.add(article)
-    session.commit()
-    session.refresh(article)
+    await session.commit()
+    await session.refresh(article)
 
     return {"success": True, "article": article}
@@ -1,14 +1,18 @@
 # app/routers/auth.py
 
 from fastapi import APIRouter, Request, Depends, HTTPException
-from fastapi.responses import RedirectResponse
-from sqlalchemy.orm import Session
-from app.db.session import get_session
+from fastapi.responses import RedirectResponse, ORJSONResponse
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from app.db.session import engine, get_session
 from app.db.models import User
+from app.db.users import upsert_google_user
 from app.utils.auth import create_jwt, verify_token
 import os
+import asyncio
+import jwt
+from typing import Dict
 from urllib.parse import urlencode
-import requests
 
 router = APIRouter()
 
@@ -27,67 +31,81 @@ if not GOOGLE_CLIENT_ID or not GOOGLE_CLIENT_SECRET:
 if not BACKEND_URL or not FRONTEND_URL:
     raise RuntimeError("Missing BACKEND_URL or FRONTEND_URL in environment")
 
+GOOGLE_ISSUERS = ("accounts.google.com", "https://accounts.google.com")
 
-# ------------------------------------------------------
-# STEP 1 — Redirect user to Google OAuth login
-# ------------------------------------------------------
-@router.get("/google/login")
-def google_login():
-    redirect_uri = f"{BACKEND_URL}/auth/google/callback"
-
-    params = {
-        "client_id": GOOGLE_CLIENT_ID,
-        "redirect_uri": redirect_uri,
-        "response_type": "code",
-        "scope": "openid email profile",
-        "access_type": "offline",
-        "prompt": "consent"
-    }
-
-    google_auth_url = (
-        "https://accounts.google.com/o/oauth2/v2/auth?" + urlencode(params)
-    )
+# Everything below only depends on the env vars above, so build it once
+REDIRECT_URI = f"{BACKEND_URL}/auth/google/callback"
+DASHBOARD_URL = f"{FRONTEND_URL}/dashboard"
 
-    return RedirectResponse(google_auth_url)
+GOOGLE_AUTH_URL = "https://accounts.google.com/o/oauth2/v2/auth?" + urlencode({
+    "client_id": GOOGLE_CLIENT_ID,
+    "redirect_uri": REDIRECT_URI,
+    "response_type": "code",
+    "scope": "openid email profile",
+    "access_type": "offline",
+    "prompt": "consent"
+})
 
 
 # ------------------------------------------------------
-# STEP 2 — Google redirects here with the ?code=
+# STEP 1 — Redirect user to Google OAuth login
 # ------------------------------------------------------
-@router.get("/google/callback")
-def google_callback(request: Request, session: Session = Depends(get_session)):
+@router.get("/google/login")
+async def google_login():
+    return RedirectResponse(GOOGLE_AUTH_URL)
 
-    code = request.query_params.get("code")
-    if not code:
-        raise HTTPException(status_code=400, detail="Authorization code missing")
 
-    redirect_uri = f"{BACKEND_URL}/auth/google/callback"
+# code -> exchange in progress. Concurrent callbacks for the same code only
+# learn its outcome; they never receive the user it signed in.
+_inflight: Dict[str, "asyncio.Future[None]"] = {}
 
+
+async def _do_exchange(request: Request, code: str) -> int:
+    """
+    Exchange an authorization code with Google and find or create the user.
+    Return the user's id.
+    """
     # Exchange `code` for access token
     token_data = {
         "client_id": GOOGLE_CLIENT_ID,
         "client_secret": GOOGLE_CLIENT_SECRET,
         "code": code,
         "grant_type": "authorization_code",
-        "redirect_uri": redirect_uri,
+        "redirect_uri": REDIRECT_URI,
     }
 
-    token_res = requests.post("https://oauth2.googleapis.com/token", data=token_data)
+    http_client = request.app.state.http_client
+    token_res = await http_client.post("https://oauth2.googleapis.com/token", data=token_data)
 
     if token_res.status_code != 200:
         raise HTTPException(status_code=400, detail="Failed to exchange code")
 
     tokens = token_res.json()
-    access_token = tokens.get("access_token")
-
-    if not access_token:
-        raise HTTPException(status_code=400, detail="Missing access token")
+    id_token = tokens.get("id_token")
+
+    if not id_token:
+        raise HTTPException(status_code=400, detail="Missing id token")
+
+    # Read the user's claims from the id_token instead of calling /userinfo.
+    # It came straight from Google's token endpoint over TLS, authenticated
+    # with our client secret, so (per OIDC Core 3.1.3.7) the signature check
+    # can be skipped; audience, issuer and expiry are still enforced.
+    try:
+        user_info = jwt.decode(
+            id_token,
+            options={
+                "verify_signature": False,
+                "verify_aud": True,
+                "verify_exp": True,
+            },
+            audience=GOOGLE_CLIENT_ID,
+        )
+    except jwt.InvalidTokenError:
+        raise HTTPException(status_code=400, detail="Invalid id token")
 
-    # Fetch Google User Info
-    user_info = requests.get(
-        "https://www.googleapis.com/oauth2/v3/userinfo",
-        headers={"Authorization": f"Bearer {access_token}"}
-    ).json()
+    # Checked by hand: PyJWT < 2.10 doesn't accept several issuers
+    if user_info.get("iss") not in GOOGLE_ISSUERS:
+        raise HTTPException(status_code=400, detail="Invalid id token")
 
     google_id = user_info.get("sub")
     email = user_info.get("email")
@@ -97,28 +115,58 @@ def google_callback(request: Request, session: Session = Depends(get_session)):
     if not google_id or not email:
         raise HTTPException(status_code=400, detail="Invalid Google user info")
 
-    # Check if user exists
-    user = session.query(User).filter(
-        (User.google_id == google_id) | (User.email == email)
-    ).first()
+    # Short-lived session opened only after the Google calls, so a pooled
+    # connection is held for the upsert rather than the whole login
+    async with AsyncSession(engine) as session:
+        user_id = await upsert_google_user(session, google_id, email, name, picture)
+
+    if user_id is None:
+        raise HTTPException(status_code=400, detail="Could not sign in this Google account")
+
+    return user_id
 
-    # Create user if not found
-    if not user:
-        user = User(
-            google_id=google_id,
-            email=email,
-            name=name,
-            picture=picture
-        )
-        session.add(user)
-        session.commit()
-        session.refresh(user)
+
+# ------------------------------------------------------
+# STEP 2 — Google redirects here with the ?code=
+# ------------------------------------------------------
+@router.get("/google/callback")
+async def google_callback(request: Request):
+
+    code = request.query_params.get("code")
+    if not code:
+        raise HTTPException(status_code=400, detail="Authorization code missing")
+
+    # A retried / double-submitted callback with the same single-use code
+    # waits for the exchange already in flight instead of repeating it. It
+    # shares a failure, but a success spent the code, so (as Google would
+    # answer a replay) it gets a 400 rather than the first caller's session.
+    pending = _inflight.get(code)
+    if pending is not None:
+        await asyncio.shield(pending)
+        raise HTTPException(status_code=400, detail="Authorization code already used")
+
+    future = asyncio.get_running_loop().create_future()
+    _inflight[code] = future
+    try:
+        user_id = await _do_exchange(request, code)
+        future.set_result(None)
+    except Exception as exc:
+        future.set_exception(exc)
+        raise
+    finally:
+        if not future.done():
+            # Leader was cancelled (client went away); fail waiters cleanly
+            future.set_exception(
+                HTTPException(status_code=400, detail="Failed to exchange code")
+            )
+        future.exception()  # mark retrieved when nobody else is waiting
+        _inflight.pop(code, None)
 
     # Generate JWT
-    token = create_jwt({"user_id": user.id})
+    token = create_jwt({"user_id": user_id})
 
     # Redirect to frontend with HTTP-only cookie
-    response = RedirectResponse(f"{FRONTEND_URL}/dashboard")
+    response = RedirectResponse(DASHBOARD_URL)
 
     response.set_cookie(
         key="quillr_token",
@@ -135,8 +183,8 @@ def google_callback(request: Request, session: Session = Depends(get_session)):
 # ------------------------------------------------------
 # WHO AM I (Frontend checks session)
 # ------------------------------------------------------
-@router.get("/me")
-def get_me(request: Request, session: Session = Depends(get_session)):
+@router.get("/me", response_class=ORJSONResponse)
+async def get_me(request: Request, session: AsyncSession = Depends(get_session)):
 
     token = request.cookies.get("quillr_token")
     if not token:
@@ -146,7 +194,13 @@ def get_me(request: Request, session: Session = Depends(get_session)):
     if not payload:
         return {"user": None}
 
-    user = session.query(User).filter(User.id == payload.get("user_id")).first()
+    user_id = payload.get("user_id")
+    if not user_id:
+        return {"user": None}
+
+    # Fetch only the columns we return instead of the whole row
+    statement = select(User.id, User.email, User.name, User.picture).where(User.id == user_id)
+    user = (await session.exec(statement)).first()
 
     if not user:
         return {"user": None}
@@ -1,8 +1,19 @@
-from fastapi import APIRouter
-from app.routers.articles import fake_articles_db
+from typing import List
+from fastapi import APIRouter, Depends
+from fastapi.responses import ORJSONResponse
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.db.session import get_session
+from app.db.models import Article
+from app.routers.articles import ArticleOut
 
 router = APIRouter()
 
-@router.get("/latest")
-def latest_articles():
-    return list(fake_articles_db.values())[::-1]
+LATEST_LIMIT = 20
+
+@router.get("/latest", response_model=List[ArticleOut], response_class=ORJSONResponse)
+async def latest_articles(session: AsyncSession = Depends(get_session)):
+    # Newest first straight from a backwards primary-key scan, no re-sort/copy
+    statement = select(Article).order_by(Article.id.desc()).limit(LATEST_LIMIT)
+    return (await session.exec(statement)).all()
@@ -1,8 +1,18 @@
 # app/utils/auth.py
 import os
+import time
+import hmac
+import json
+import base64
+import hashlib
+import threading
+from calendar import timegm
+from datetime import datetime
 from typing import Optional, Dict
-from fastapi import Request
-from jose import jwt, JWTError
+from fastapi import Request, HTTPException
+import jwt
+from jwt import InvalidTokenError as JWTError
+from cachetools import TTLCache
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -11,15 +21,51 @@ load_dotenv()
 SECRET_KEY = os.getenv("SECRET_KEY", "dev-secret-please-change")
 ALGORITHM = "HS256"
 
+# Pre-built decode arguments, so verify_token doesn't re-encode the key or
+# allocate a new algorithms list per call
+SECRET_KEY_BYTES = SECRET_KEY.encode("utf-8")
+_ALGOS = (ALGORITHM,)
+
+
+def _b64url(raw: bytes) -> bytes:
+    return base64.urlsafe_b64encode(raw).rstrip(b"=")
+
+
+# Signing state that never changes: the encoded HS256 header and an HMAC
+# keyed with SECRET_KEY, copied per token instead of re-keyed.
+_JWT_HEADER = _b64url(b'{"alg":"HS256","typ":"JWT"}')
+_JWT_SIGNER = hmac.new(SECRET_KEY_BYTES, digestmod=hashlib.sha256)
+
+_BEARER = "bearer "
+_UNSET = object()
+
+# Decoded payloads keyed by a digest of the token, so repeat requests
+# carrying the same cookie skip the HMAC check + JSON parse.
+_JWT_CACHE_TTL = 30
+_jwt_cache: TTLCache = TTLCache(maxsize=10_000, ttl=_JWT_CACHE_TTL)
+# TTLCache isn't thread-safe; sync routes/deps run in FastAPI's threadpool
+_jwt_cache_lock = threading.Lock()
+
 
 # ----------------------------------------------------
 # CREATE JWT
 # ----------------------------------------------------
 def create_jwt(data: Dict) -> str:
     """
-    Create and return a signed JWT token.
+    Create and return a signed HS256 JWT token.
+    Output is the same as jwt.encode(data, SECRET_KEY, algorithm=ALGORITHM).
     """
-    return jwt.encode(data, SECRET_KEY, algorithm=ALGORITHM)
+    payload = dict(data)
+    for claim in ("exp", "iat", "nbf"):
+        if isinstance(payload.get(claim), datetime):
+            payload[claim] = timegm(payload[claim].utctimetuple())
+
+    body = _b64url(json.dumps(payload, separators=(",", ":")).encode())
+    signing_input = _JWT_HEADER + b"." + body
+
+    signer = _JWT_SIGNER.copy()
+    signer.update(signing_input)
+    return (signing_input + b"." + _b64url(signer.digest())).decode()
 
 
 # ----------------------------------------------------
@@ -30,15 +76,29 @@ def verify_token(token: str) -> Optional[dict]:
     Verify and decode a JWT token.
     Return decoded payload or None if invalid.
     """
-    if not token:
+    # A JWT is three dot-separated segments and its header always encodes
+    # to "eyJ..." ('{"'); reject junk before hashing or decoding it.
+    if not token or token.count(".") != 2 or not token.startswith("eyJ"):
         return None
 
+    key = hashlib.blake2b(token.encode(), digest_size=16).digest()
+    with _jwt_cache_lock:
+        cached = _jwt_cache.get(key)
+    if cached is not None:
+        return cached
+
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        return payload
+        payload = jwt.decode(token, SECRET_KEY_BYTES, algorithms=_ALGOS)
     except JWTError:
         return None
 
+    # Don't cache tokens that would expire while still in the cache
+    exp = payload.get("exp")
+    if exp is None or exp > time.time() + _JWT_CACHE_TTL:
+        with _jwt_cache_lock:
+            _jwt_cache[key] = payload
+    return payload
+
 
 # ----------------------------------------------------
 # GET CURRENT USER ID FROM COOKIE OR HEADER
@@ -47,7 +107,18 @@ def get_current_user_id(request: Request) -> Optional[int]:
     """
     Get user_id from cookie 'quillr_token'
     If not in cookies, fallback to Authorization: Bearer <token>
+    Resolved once per request and memoized on request.state.user_id.
     """
+    cached = getattr(request.state, "user_id", _UNSET)
+    if cached is not _UNSET:
+        return cached
+
+    user_id = _user_id_from_request(request)
+    request.state.user_id = user_id
+    return user_id
+
+
+def _user_id_from_request(request: Request) -> Optional[int]:
     token = None
 
     # Try HTTP-only cookie
@@ -58,8 +129,9 @@ def get_current_user_id(request: Request) -> Optional[int]:
     # Try Authorization header
     if not token:
         auth_header = request.headers.get("Authorization")
-        if auth_header and auth_header.lower().startswith("bearer "):
-            token = auth_header.split(" ", 1)[1].strip()
+        # Compare just the 7-char scheme prefix instead of lowercasing/splitting
+        if auth_header and auth_header[:7].lower() == _BEARER:
+            token = auth_header[7:].strip()
 
     if not token:
         return None
@@ -69,3 +141,18 @@ def get_current_user_id(request: Request) -> Optional[int]:
         return None
 
     return payload.get("user_id")
+
+
+# ----------------------------------------------------
+# DEPENDENCY: REQUIRE AN AUTHENTICATED USER
+# ----------------------------------------------------
+async def current_user_id(request: Request) -> int:
+    """
+    FastAPI dependency returning the logged-in user's id, or 401.
+    Use as `user_id: int = Depends(current_user_id)`; FastAPI caches it
+    per request so the token is decoded once however many deps need it.
+    """
+    user_id = get_current_user_id(request)
+    if not user_id:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    return user_id
@@ -0,0 +1,43 @@
+"""indexes for author lookups, trending and google_id upserts
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-15 00:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import context, op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0002"
+down_revision: Union[str, None] = "0001"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # The old find-then-insert login could race and leave several rows per
+    # google_id; those must be merged by hand before the index can exist.
+    if not context.is_offline_mode():
+        duplicates = op.get_bind().execute(sa.text(
+            'SELECT google_id FROM "user" WHERE google_id IS NOT NULL '
+            'GROUP BY google_id HAVING COUNT(*) > 1'
+        )).scalars().all()
+        if duplicates:
+            raise RuntimeError(
+                "Cannot add unique index ix_user_google_id; merge or delete the "
+                "duplicate user rows for these google ids first: " + ", ".join(duplicates)
+            )
+
+    op.create_index(op.f("ix_user_google_id"), "user", ["google_id"], unique=True)
+    op.create_index(op.f("ix_article_author_id"), "article", ["author_id"], unique=False)
+    op.create_index("ix_article_trending", "article", ["views", "likes", "created_at"], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index("ix_article_trending", table_name="article")
+    op.drop_index(op.f("ix_article_author_id"), table_name="article")
+    op.drop_index(op.f("ix_user_google_id"), table_name="user")
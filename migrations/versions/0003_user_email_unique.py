@@ -0,0 +1,38 @@
+"""unique index on user.email
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-15 00:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import context, op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0003"
+down_revision: Union[str, None] = "0002"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Older logins matched on google_id only and may have left several rows
+    # per email; those must be merged by hand before the index can exist.
+    if not context.is_offline_mode():
+        duplicates = op.get_bind().execute(sa.text(
+            'SELECT email FROM "user" GROUP BY email HAVING COUNT(*) > 1'
+        )).scalars().all()
+        if duplicates:
+            raise RuntimeError(
+                "Cannot add unique index ix_user_email; merge or delete the "
+                "duplicate user rows for these emails first: " + ", ".join(duplicates)
+            )
+
+    op.create_index(op.f("ix_user_email"), "user", ["email"], unique=True)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f("ix_user_email"), table_name="user")
@@ -0,0 +1,31 @@
+"""add user.updated_at
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-15 00:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0004"
+down_revision: Union[str, None] = "0003"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Add nullable, backfill from created_at, then tighten (batch mode keeps
+    # the last step working on SQLite too)
+    op.add_column("user", sa.Column("updated_at", sa.DateTime(), nullable=True))
+    op.execute('UPDATE "user" SET updated_at = created_at')
+    with op.batch_alter_table("user") as batch_op:
+        batch_op.alter_column("updated_at", existing_type=sa.DateTime(), nullable=False)
+
+
+def downgrade() -> None:
+    op.drop_column("user", "updated_at")